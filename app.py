@@ -1,14 +1,21 @@
 import os
-from datetime import datetime, date, timedelta
+import csv
+import hashlib
+import heapq
+import hmac
+import io
+import json
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, date, timedelta, timezone
 from collections import defaultdict
-from slack_bolt import App
-from slack_bolt.adapter.flask import SlackRequestHandler
-from flask import Flask, request, jsonify
+import click
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from slack_sdk.errors import SlackApiError
 from sqlalchemy.orm import joinedload
-from dateutil.parser import parse
-from notion_client import Client as NotionClient
 import urllib.parse
 
 # Environment configuration
@@ -23,13 +30,66 @@ HR_CHANNEL_ID = os.environ.get("HR_CHANNEL_ID", "...") #Enter the HR's ID from y
 NOTION_API_KEY = os.environ.get("NOTION_API_KEY", "...") #Enter your Notion secret key
 NOTION_TASKS_DB_ID = os.environ.get("NOTION_TASKS_DB_ID", "...") #Enter the Table ID (from the url)
 
-app = App(token=SLACK_BOT_TOKEN, signing_secret=SLACK_SIGNING_SECRET)
-flask_app = Flask(__name__)
-handler = SlackRequestHandler(app)
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///leaveapp.db")
 
-flask_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///leaveapp.db'
-flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(flask_app)
+# Manager routing and digest mode
+ORG_MANAGER_MAP_FILE = os.environ.get("ORG_MANAGER_MAP_FILE", "") #JSON file mapping employee Slack IDs to manager Slack IDs
+MANAGER_DIGEST_ENABLED = os.environ.get("MANAGER_DIGEST_ENABLED", "").lower() in ("1", "true", "yes")
+MANAGER_DIGEST_WINDOW_SECONDS = int(os.environ.get("MANAGER_DIGEST_WINDOW_SECONDS", "900"))
+MANAGER_DIGEST_CLAIM_TIMEOUT_SECONDS = int(os.environ.get("MANAGER_DIGEST_CLAIM_TIMEOUT_SECONDS", "600")) #Claimed but unsent digest items are reclaimed after this
+
+# HR export
+HR_EXPORT_TOKEN = os.environ.get("HR_EXPORT_TOKEN", "") #Bearer token for /hr/leave_history; the route is disabled when empty
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", "1000"))
+
+# Absence calendar feeds
+CALENDAR_FEED_TOKEN = os.environ.get("CALENDAR_FEED_TOKEN", "") #Shared ?token= for the .ics feeds; the feeds are disabled when empty
+CALENDAR_FEED_PAST_DAYS = int(os.environ.get("CALENDAR_FEED_PAST_DAYS", "90"))
+CALENDAR_FEED_MAX_AGE_SECONDS = int(os.environ.get("CALENDAR_FEED_MAX_AGE_SECONDS", "300"))
+
+# Archival of finished leave requests
+ARCHIVE_RETENTION_DAYS = int(os.environ.get("ARCHIVE_RETENTION_DAYS", "365")) #Finished requests that ended longer ago than this move to leave_request_archive
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "5000"))
+
+# Reminders, escalation and auto-expiry
+LEAVE_REMINDER_DAYS_BEFORE = int(os.environ.get("LEAVE_REMINDER_DAYS_BEFORE", "1"))
+LEAVE_REMINDER_HOUR = int(os.environ.get("LEAVE_REMINDER_HOUR", "9"))
+PENDING_ESCALATION_HOURS = int(os.environ.get("PENDING_ESCALATION_HOURS", "48"))
+SCHEDULER_RESYNC_SECONDS = int(os.environ.get("SCHEDULER_RESYNC_SECONDS", "300")) #Re-read scheduled events written by other processes; 0 disables
+
+DEFAULT_CONFIG = {
+    "SLACK_BOT_TOKEN": SLACK_BOT_TOKEN,
+    "SLACK_SIGNING_SECRET": SLACK_SIGNING_SECRET,
+    "MANAGER_USER_ID": MANAGER_USER_ID,
+    "HR_CHANNEL_ID": HR_CHANNEL_ID,
+    "NOTION_API_KEY": NOTION_API_KEY,
+    "NOTION_TASKS_DB_ID": NOTION_TASKS_DB_ID,
+    "ORG_MANAGER_MAP": {},
+    "ORG_MANAGER_MAP_FILE": ORG_MANAGER_MAP_FILE,
+    "MANAGER_DIGEST_ENABLED": MANAGER_DIGEST_ENABLED,
+    "MANAGER_DIGEST_WINDOW_SECONDS": MANAGER_DIGEST_WINDOW_SECONDS,
+    "MANAGER_DIGEST_CLAIM_TIMEOUT_SECONDS": MANAGER_DIGEST_CLAIM_TIMEOUT_SECONDS,
+    "HR_EXPORT_TOKEN": HR_EXPORT_TOKEN,
+    "EXPORT_CHUNK_SIZE": EXPORT_CHUNK_SIZE,
+    "CALENDAR_FEED_TOKEN": CALENDAR_FEED_TOKEN,
+    "CALENDAR_FEED_PAST_DAYS": CALENDAR_FEED_PAST_DAYS,
+    "CALENDAR_FEED_MAX_AGE_SECONDS": CALENDAR_FEED_MAX_AGE_SECONDS,
+    "ARCHIVE_RETENTION_DAYS": ARCHIVE_RETENTION_DAYS,
+    "ARCHIVE_BATCH_SIZE": ARCHIVE_BATCH_SIZE,
+    "LEAVE_REMINDER_DAYS_BEFORE": LEAVE_REMINDER_DAYS_BEFORE,
+    "LEAVE_REMINDER_HOUR": LEAVE_REMINDER_HOUR,
+    "PENDING_ESCALATION_HOURS": PENDING_ESCALATION_HOURS,
+    "SCHEDULER_RESYNC_SECONDS": SCHEDULER_RESYNC_SECONDS,
+    "SQLALCHEMY_DATABASE_URI": DATABASE_URL,
+    "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+}
+
+# The models are declared against an unbound SQLAlchemy instance; create_app()
+# binds it, so importing this module never touches the database.
+db = SQLAlchemy()
+
+# Set by create_app(). Handlers use it to open app contexts from Bolt's worker threads.
+flask_app = None
 
 # Constants and config
 LEAVE_TYPES_DATA = [
@@ -61,20 +121,164 @@ class LeaveRequest(db.Model):
     leave_type_id = db.Column(db.Integer, db.ForeignKey('leave_type.id'), nullable=False)
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=False)
-    status = db.Column(db.String(20), nullable=False)  # "approved", "declined", or "pending"
+    status = db.Column(db.String(20), nullable=False)  # "approved", "declined", "pending" or "expired"
     leave_type = db.relationship('LeaveType')
 
 
+class LeaveRequestArchive(db.Model):
+    """Finished requests moved out of leave_request by archive_finished_leave_requests()."""
+    __tablename__ = 'leave_request_archive'
+    id = db.Column(db.Integer, primary_key=True)
+    original_id = db.Column(db.Integer, nullable=False, index=True)  # leave_request.id before archival
+    user_id = db.Column(db.String(50), nullable=False)
+    leave_type_id = db.Column(db.Integer, db.ForeignKey('leave_type.id'), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False)
+    leave_type = db.relationship('LeaveType')
+
+
+class ScheduledLeaveEvent(db.Model):
+    """A reminder, escalation or expiry due for a leave request; fired_at is stamped when it fires.
+
+    Fired rows are kept so that a pending request with no rows at all is one that was never scheduled
+    (see backfill_scheduled_leave_events).
+    """
+    __tablename__ = 'scheduled_leave_event'
+    id = db.Column(db.Integer, primary_key=True)
+    leave_request_id = db.Column(db.Integer, db.ForeignKey('leave_request.id'), nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False)  # "reminder", "escalation" or "expiry"
+    due_at = db.Column(db.DateTime, nullable=False, index=True)
+    fired_at = db.Column(db.DateTime, nullable=True)
+
+
+class ManagerRequestMessage(db.Model):
+    """The manager's Slack message carrying a pending request's buttons, so it can be updated on expiry."""
+    __tablename__ = 'manager_request_message'
+    leave_request_id = db.Column(db.Integer, db.ForeignKey('leave_request.id'), primary_key=True)
+    channel_id = db.Column(db.String(50), nullable=False)
+    message_ts = db.Column(db.String(50), nullable=False)
+    is_digest = db.Column(db.Boolean, nullable=False, default=False)
+
+
+class ManagerDigestItem(db.Model):
+    """A pending request waiting to go out in its manager's next digest."""
+    __tablename__ = 'manager_digest_item'
+    leave_request_id = db.Column(db.Integer, db.ForeignKey('leave_request.id'), primary_key=True)
+    manager_id = db.Column(db.String(50), nullable=False, index=True)
+    leave_days = db.Column(db.Integer, nullable=False)
+    remaining_balance = db.Column(db.Integer)
+    proof_details = db.Column(db.Text)
+    tasks_summary = db.Column(db.Text)  # overlapping Notion tasks, as shown in the single-request DM
+    queued_at = db.Column(db.DateTime, nullable=False)
+    batch_id = db.Column(db.String(32), index=True)  # set once a digest send has claimed the row
+    claimed_at = db.Column(db.DateTime)
+    leave_request = db.relationship('LeaveRequest')
+
+
 USER_DISCUSSION_STATE = {}
 
+# Lazily constructed clients
+_client_lock = threading.Lock()
+
+
+def _state():
+    return flask_app.extensions["slack_leave"]
+
+
+def get_bolt_app():
+    """Build the Bolt app on first use; App() calls auth.test, so this is where the token gets verified."""
+    state = _state()
+    if state["bolt_app"] is None:
+        with _client_lock:
+            if state["bolt_app"] is None:
+                from slack_bolt import App
+
+                bolt_app = App(
+                    token=flask_app.config["SLACK_BOT_TOKEN"],
+                    signing_secret=flask_app.config["SLACK_SIGNING_SECRET"],
+                )
+                register_slack_listeners(bolt_app)
+                state["bolt_app"] = bolt_app
+    return state["bolt_app"]
+
+
+def get_slack_handler():
+    state = _state()
+    if state["slack_handler"] is None:
+        from slack_bolt.adapter.flask import SlackRequestHandler
+
+        bolt_app = get_bolt_app()
+        with _client_lock:
+            if state["slack_handler"] is None:
+                state["slack_handler"] = SlackRequestHandler(bolt_app)
+    return state["slack_handler"]
+
+
+def get_notion_client():
+    state = _state()
+    if state["notion_client"] is None:
+        from notion_client import Client as NotionClient
+
+        with _client_lock:
+            if state["notion_client"] is None:
+                state["notion_client"] = NotionClient(auth=flask_app.config["NOTION_API_KEY"])
+    return state["notion_client"]
+
+
+def load_org_manager_map():
+    """Employee -> manager mapping, read once per process from ORG_MANAGER_MAP_FILE and ORG_MANAGER_MAP."""
+    state = _state()
+    if state["org_manager_map"] is None:
+        mapping = {}
+        path = flask_app.config.get("ORG_MANAGER_MAP_FILE")
+        if path:
+            with open(path) as f:
+                mapping.update(json.load(f))
+        mapping.update(flask_app.config.get("ORG_MANAGER_MAP") or {})
+        state["org_manager_map"] = mapping
+    return state["org_manager_map"]
+
+
+def get_manager_for(user_id):
+    return load_org_manager_map().get(user_id, flask_app.config["MANAGER_USER_ID"])
+
+
+def open_dm_channel(client, user_id):
+    """conversations_open once per user; the DM channel ID never changes."""
+    channels = _state()["dm_channels"]
+    if user_id not in channels:
+        dm = client.conversations_open(users=user_id)
+        channels[user_id] = dm["channel"]["id"]
+    return channels[user_id]
+
+
 # Utility functions
+def load_leave_type_catalog():
+    """Return the leave types as plain dicts, cached per process after the first DB read."""
+    state = _state()
+    if state["leave_type_catalog"] is None:
+        with flask_app.app_context():
+            leave_types = LeaveType.query.filter(LeaveType.name.in_(["Casual", "Sick"])).order_by(LeaveType.id).all()
+            state["leave_type_catalog"] = [
+                {"id": lt.id, "name": lt.name, "max_days": lt.max_days} for lt in leave_types
+            ]
+    return state["leave_type_catalog"]
+
+
+def ensure_leave_type_catalog():
+    """Seed the leave types once per process instead of on every /applyforleave."""
+    if _state()["leave_type_catalog"] is None:
+        initialize_leave_types_and_user_balances()
+    return load_leave_type_catalog()
+
+
 def get_leave_type_options():
-    with flask_app.app_context():
-        leave_types = LeaveType.query.filter(LeaveType.name.in_(["Casual", "Sick"])).all()
-        options = []
-        for lt in leave_types:
-            options.append({"text": {"type": "plain_text", "text": lt.name}, "value": str(lt.id)})
-        return options
+    options = []
+    for lt in load_leave_type_catalog():
+        options.append({"text": {"type": "plain_text", "text": lt["name"]}, "value": str(lt["id"])})
+    return options
 
 
 def initialize_leave_types_and_user_balances():
@@ -87,16 +291,16 @@ def initialize_leave_types_and_user_balances():
                 lt = LeaveType(name=lt_data["name"], max_days=lt_data["max_days"])
                 db.session.add(lt)
         db.session.commit()
+    _state()["leave_type_catalog"] = None
 
 
 def initialize_user_balances(user_id):
     with flask_app.app_context():
-        leave_types = LeaveType.query.filter(LeaveType.name.in_(["Casual", "Sick"])).all()
-        for lt in leave_types:
-            existing = UserLeaveBalance.query.filter_by(user_id=user_id, leave_type_id=lt.id).first()
+        for lt in load_leave_type_catalog():
+            existing = UserLeaveBalance.query.filter_by(user_id=user_id, leave_type_id=lt["id"]).first()
             if not existing:
-                balance = lt.max_days
-                new_balance = UserLeaveBalance(user_id=user_id, leave_type_id=lt.id, leave_balance=balance)
+                balance = lt["max_days"]
+                new_balance = UserLeaveBalance(user_id=user_id, leave_type_id=lt["id"], leave_balance=balance)
                 db.session.add(new_balance)
         db.session.commit()
 
@@ -184,6 +388,8 @@ def fetch_user_tasks_with_deadlines(notion, tasks_db_id, notion_user_id, leave_s
         })
 
     # Sort tasks by due date safely using dateutil.parser
+    from dateutil.parser import parse
+
     def safe_due(task):
         due_str = task.get('due')
         if not due_str:
@@ -197,11 +403,10 @@ def fetch_user_tasks_with_deadlines(notion, tasks_db_id, notion_user_id, leave_s
     return tasks
 
 # Slack command to open leave modal
-@app.command("/applyforleave")
 def open_leave_modal(ack, body, client, logger):
     user_id = body["user_id"]
     with flask_app.app_context():
-        initialize_leave_types_and_user_balances()
+        ensure_leave_type_catalog()
         initialize_user_balances(user_id)
         leave_options = get_leave_type_options()
         balances = UserLeaveBalance.query.filter_by(user_id=user_id).options(joinedload(UserLeaveBalance.leave_type)).all()
@@ -280,7 +485,6 @@ def open_leave_modal(ack, body, client, logger):
         logger.error(f"Error opening leave modal: {e}")
 
 # Handle modal submission, leave validation, Notion check, Slack messaging
-@app.view("leave_request_modal")
 def handle_leave_submission(ack, body, client, view, logger):
     user_id = body["user"]["id"]
     values = view["state"]["values"]
@@ -360,10 +564,11 @@ def handle_leave_submission(ack, body, client, view, logger):
         )
         db.session.add(leave_request)
         db.session.commit()
+        leave_request_id = leave_request.id
+    schedule_leave_events(leave_request_id, start_dt, user_leave_type.name)
     skipped_weekends_str = ", ".join(day.strftime("%-d/%-m/%y") for day in skipped_weekends) if skipped_weekends else "none"
 
     # Notion Integration
-    notion_client = NotionClient(auth=NOTION_API_KEY)
     # Slack to Notion user ID mapping: must be maintained manually for real users
     slack_to_notion_user_map = {
         # Example mapping
@@ -373,7 +578,7 @@ def handle_leave_submission(ack, body, client, view, logger):
     notion_user_id = slack_to_notion_user_map.get(user_id)
     tasks = []
     if notion_user_id:
-        tasks = fetch_user_tasks_with_deadlines(notion_client, NOTION_TASKS_DB_ID, notion_user_id, start_dt, end_dt)
+        tasks = fetch_user_tasks_with_deadlines(get_notion_client(), flask_app.config["NOTION_TASKS_DB_ID"], notion_user_id, start_dt, end_dt)
 
     if skipped_weekends_str.lower() != "none":
         confirmation_text = (
@@ -413,31 +618,38 @@ def handle_leave_submission(ack, body, client, view, logger):
         f"Tasks overlapping with the leave date:\n{tasks_text}"
     )
 
+    manager_id = get_manager_for(user_id)
+    if flask_app.config["MANAGER_DIGEST_ENABLED"]:
+        queue_for_manager_digest(
+            leave_request_id, manager_id, leave_days,
+            remaining_balance=remaining_leave, proof_details=proof_details,
+            tasks_summary=tasks_text if tasks else "",
+        )
+        return
 
     try:
-        dm = client.conversations_open(users=MANAGER_USER_ID)
-        channel_id = dm["channel"]["id"]
-        client.chat_postMessage(channel=channel_id, text=manager_message, blocks=[
+        channel_id = open_dm_channel(client, manager_id)
+        response = client.chat_postMessage(channel=channel_id, text=manager_message, blocks=[
             {"type": "section", "text": {"type": "mrkdwn", "text": manager_message}},
             {
                 "type": "actions",
                 "block_id": "approval_buttons",
                 "elements": [
                     {"type": "button", "text": {"type": "plain_text", "text": "Approve"}, "style": "primary",
-                     "value": f"{user_id}|approved|{leave_days}|{leave_type_id}", "action_id": "approve_button"},
+                     "value": f"{user_id}|approved|{leave_days}|{leave_type_id}|{leave_request_id}", "action_id": "approve_button"},
                     {"type": "button", "text": {"type": "plain_text", "text": "Decline"}, "style": "danger",
-                     "value": f"{user_id}|declined|{leave_days}|{leave_type_id}", "action_id": "decline_button"},
+                     "value": f"{user_id}|declined|{leave_days}|{leave_type_id}|{leave_request_id}", "action_id": "decline_button"},
                     {"type": "button", "text": {"type": "plain_text", "text": "Discuss"}, "style": "primary",
-                     "value": f"{user_id}|discuss|{leave_days}|{leave_type_id}", "action_id": "discuss_button"},
+                     "value": f"{user_id}|discuss|{leave_days}|{leave_type_id}|{leave_request_id}", "action_id": "discuss_button"},
                 ],
             },
         ])
+        remember_manager_message([leave_request_id], response["channel"], response["ts"])
     except Exception as e:
-        app.logger.error(f"Failed to notify manager: {e}")
+        logger.error(f"Failed to notify manager: {e}")
 
 
 # /whos_away command
-@app.command("/whos_away")
 def whos_away_command(ack, body, client, logger):
     ack()
     user_id = body["user_id"]
@@ -472,7 +684,6 @@ def whos_away_command(ack, body, client, logger):
     except SlackApiError as e:
         logger.error(f"Error opening who's away modal: {e}")
 
-@app.view("whos_away_modal")
 def whos_away_modal_submission(ack, body, client, view, logger):
     ack()
     user_id = body["user"]["id"]
@@ -537,7 +748,6 @@ def whos_away_modal_submission(ack, body, client, view, logger):
         logger.error(f"Failed to send who's away DM: {e}")
 
 # /leave_balance command
-@app.command("/leave_balance")
 def leave_balance_command(ack, body, client, logger):
     ack()
     user_id = body["user_id"]
@@ -567,29 +777,46 @@ def set_user_tasks_on_leave(notion_client, tasks):
             print(f"Failed to update leave status for Notion page {page_id}: {e}")
 
 
-@app.action("approve_button")
-@app.action("decline_button")
-def handle_final_decision(ack, body, client, logger):
-    ack()
-    action_value = body["actions"][0]["value"]
-    parts = action_value.split("|")
-    user_id = parts[0]
-    decision = parts[1]
-    requested_days = int(parts[2])
-    leave_type_id = int(parts[3])
-    
-    manager_id = body["user"]["id"]
-    decision_text = "approved" if decision == "approved" else "declined"
+def record_leave_decision(user_id, leave_type_id, requested_days, decision_text, leave_request):
+    """Move a pending request to decision_text ("approved", "declined" or "expired") and debit the
+    balance on approval. The caller commits, so bulk approvals share one transaction.
+
+    The status change is a conditional UPDATE, so a request that is no longer pending (decided by an
+    earlier click, or expired) is left untouched and False is returned.
+    """
+    claimed = db.session.execute(
+        db.update(LeaveRequest)
+        .where(LeaveRequest.id == leave_request.id, LeaveRequest.status == "pending")
+        .values(status=decision_text)
+    ).rowcount
+    if not claimed:
+        return False
+    # Decided requests no longer need nudging or expiring; only approved leave keeps its reminder
+    cancelled_kinds = ["escalation", "expiry"] if decision_text == "approved" else ["escalation", "expiry", "reminder"]
+    ScheduledLeaveEvent.query.filter(
+        ScheduledLeaveEvent.leave_request_id == leave_request.id,
+        ScheduledLeaveEvent.kind.in_(cancelled_kinds),
+    ).delete(synchronize_session=False)
+    ManagerRequestMessage.query.filter_by(leave_request_id=leave_request.id).delete(synchronize_session=False)
+    if decision_text == "approved":
+        user_balance_record = UserLeaveBalance.query.filter_by(user_id=user_id, leave_type_id=leave_type_id).first()
+        if user_balance_record:
+            user_balance_record.leave_balance = max(0, user_balance_record.leave_balance - requested_days)
+    return True
 
-    client.chat_update(
-        channel=body["channel"]["id"],
-        ts=body["message"]["ts"],
-        text=f"Leave request has been *{decision_text}* by <@{manager_id}>.",
-        blocks=[
-            {"type": "section", "text": {"type": "mrkdwn", "text": f"Leave request has been *{decision_text}* by <@{manager_id}>."}}
-        ],
-    )
 
+def remember_manager_message(leave_request_ids, channel_id, message_ts, is_digest=False):
+    with flask_app.app_context():
+        for leave_request_id in leave_request_ids:
+            db.session.merge(ManagerRequestMessage(
+                leave_request_id=leave_request_id, channel_id=channel_id,
+                message_ts=message_ts, is_digest=is_digest,
+            ))
+        db.session.commit()
+
+
+def notify_leave_decision(client, user_id, requested_days, decision_text, manager_id, start_dt, end_dt):
+    """DM the employee, post to HR with overlapping Notion tasks, and flag those tasks on approval."""
     client.chat_postMessage(
         channel=user_id,
         text=(
@@ -598,37 +825,26 @@ def handle_final_decision(ack, body, client, logger):
         ),
     )
 
-    # Fetch overlapping tasks for HR notification
-    with flask_app.app_context():
-        leave_request = LeaveRequest.query.filter_by(user_id=user_id, leave_type_id=leave_type_id).order_by(LeaveRequest.id.desc()).first()
-        if leave_request:
-            start_dt = leave_request.start_date
-            end_dt = leave_request.end_date
-        else:
-            start_dt = None
-            end_dt = None
-
     # Notion Integration to get tasks overlapping leave dates
-    tasks_text = "No overlapping tasks."
+    tasks = []
     if start_dt and end_dt:
-        notion_client = NotionClient(auth=NOTION_API_KEY)
-
         # Map slack user IDs to Notion IDs - maintain this properly
         slack_to_notion_user_map = {
             "U09DHCLQK8A": "26bd872b-594c-81cd-8aa1-0002dc180e8b"  # example
         }
         notion_user_id = slack_to_notion_user_map.get(user_id)
-        
+
         if notion_user_id:
             tasks = fetch_user_tasks_with_deadlines(
-                notion_client,
-                NOTION_TASKS_DB_ID,
+                get_notion_client(),
+                flask_app.config["NOTION_TASKS_DB_ID"],
                 notion_user_id,
                 start_dt,
                 end_dt
             )
-            if tasks:
-                tasks_text = "\n".join([f"• {t['name']} (Due: {t['due'] or 'N/A'}) [{t['project'] or 'Unknown'}]" for t in tasks])
+    tasks_text = "No overlapping tasks."
+    if tasks:
+        tasks_text = "\n".join([f"• {t['name']} (Due: {t['due'] or 'N/A'}) [{t['project'] or 'Unknown'}]" for t in tasks])
 
     hr_message = (
         f"Leave request from <@{user_id}> for *{requested_days} day(s)* was *{decision_text}* by <@{manager_id}>.\n"
@@ -636,47 +852,74 @@ def handle_final_decision(ack, body, client, logger):
     )
 
     client.chat_postMessage(
-        channel=HR_CHANNEL_ID,
+        channel=flask_app.config["HR_CHANNEL_ID"],
         text=hr_message,
     )
 
+    if decision_text == "approved" and tasks:
+        set_user_tasks_on_leave(get_notion_client(), tasks)
+
+
+def handle_final_decision(ack, body, client, logger):
+    ack()
+    action_value = body["actions"][0]["value"]
+    parts = action_value.split("|")
+    user_id = parts[0]
+    decision = parts[1]
+    requested_days = int(parts[2])
+    leave_type_id = int(parts[3])
+    leave_request_id = int(parts[4]) if len(parts) > 4 and parts[4] else None
+    
+    manager_id = body["user"]["id"]
+    decision_text = "approved" if decision == "approved" else "declined"
+
     # Update leave request status and user leave balance
     with flask_app.app_context():
-        leave_request = LeaveRequest.query.filter_by(
-            user_id=user_id,
-            leave_type_id=leave_type_id,
-            status="pending"
-        ).order_by(LeaveRequest.id.desc()).first()
-        if leave_request:
-            leave_request.status = decision_text
-            db.session.commit()
-        if decision == "approved":
-            user_balance_record = UserLeaveBalance.query.filter_by(user_id=user_id, leave_type_id=leave_type_id).first()
-            if user_balance_record:
-                user_balance_record.leave_balance = max(0, user_balance_record.leave_balance - requested_days)
-                db.session.commit()
-            if start_dt and end_dt:
-                notion_client = NotionClient(auth=NOTION_API_KEY)
-                slack_to_notion_user_map = {
-                    "U09DHCLQK8A": "26bd872b-594c-81cd-8aa1-0002dc180e8b"  # example mapping
-                    # add your actual mappings here
-                }
-                notion_user_id = slack_to_notion_user_map.get(user_id)
-                if notion_user_id:
-                    tasks = fetch_user_tasks_with_deadlines(
-                        notion_client,
-                        NOTION_TASKS_DB_ID,
-                        notion_user_id,
-                        start_dt,
-                        end_dt
-                    )
-                    if tasks:
-                        set_user_tasks_on_leave(notion_client, tasks)
-
-@app.action("discuss_button")
+        if leave_request_id:
+            leave_request = db.session.get(LeaveRequest, leave_request_id)
+        else:
+            # Buttons sent before request IDs were included in their values
+            leave_request = LeaveRequest.query.filter_by(
+                user_id=user_id,
+                leave_type_id=leave_type_id,
+                status="pending"
+            ).order_by(LeaveRequest.id.desc()).first()
+        decided = bool(leave_request) and record_leave_decision(user_id, leave_type_id, requested_days, decision_text, leave_request)
+        if decided:
+            start_dt = leave_request.start_date
+            end_dt = leave_request.end_date
+        db.session.commit()
+        current_status = db.session.get(LeaveRequest, leave_request.id).status if leave_request else None
+
+    if not decided:
+        status_text = f"already *{current_status}*" if current_status and current_status != "pending" else "no longer pending"
+        client.chat_update(
+            channel=body["channel"]["id"],
+            ts=body["message"]["ts"],
+            text=f"This leave request is {status_text}; nothing was changed.",
+            blocks=[
+                {"type": "section", "text": {"type": "mrkdwn", "text": f"This leave request from <@{user_id}> is {status_text}; nothing was changed."}}
+            ],
+        )
+        return
+    bump_calendar_feed_versions([user_id])
+
+    client.chat_update(
+        channel=body["channel"]["id"],
+        ts=body["message"]["ts"],
+        text=f"Leave request has been *{decision_text}* by <@{manager_id}>.",
+        blocks=[
+            {"type": "section", "text": {"type": "mrkdwn", "text": f"Leave request has been *{decision_text}* by <@{manager_id}>."}}
+        ],
+    )
+
+    notify_leave_decision(client, user_id, requested_days, decision_text, manager_id, start_dt, end_dt)
+
 def handle_discuss_action(ack, body, client, logger):
     ack()
-    user_id, _, requested_days, leave_type_id = body["actions"][0]["value"].split("|")
+    parts = body["actions"][0]["value"].split("|")
+    user_id, _, requested_days, leave_type_id = parts[:4]
+    leave_request_id = parts[4] if len(parts) > 4 else ""
     manager_id = body["user"]["id"]
     try:
         client.chat_postEphemeral(
@@ -706,13 +949,12 @@ def handle_discuss_action(ack, body, client, logger):
                     "type": "button",
                     "text": {"type": "plain_text", "text": "Re-request Leave"},
                     "style": "primary",
-                    "value": f"{user_id}|{requested_days}|{leave_type_id}",
+                    "value": f"{user_id}|{requested_days}|{leave_type_id}|{leave_request_id}",
                     "action_id": "rerequest_button",
                 }]}
             ],
         )
-        dm = client.conversations_open(users=manager_id)
-        manager_channel = dm["channel"]["id"]
+        manager_channel = open_dm_channel(client, manager_id)
         client.chat_postMessage(
             channel=manager_channel,
             text=(
@@ -723,13 +965,14 @@ def handle_discuss_action(ack, body, client, logger):
     except Exception as e:
         logger.error(f"Failed to send discussion DM: {e}")
 
-@app.action("rerequest_button")
 def handle_rerequest_button(ack, body, client, logger):
     ack()
-    user_id, requested_days, leave_type_id = body["actions"][0]["value"].split("|")
+    parts = body["actions"][0]["value"].split("|")
+    user_id, requested_days, leave_type_id = parts[:3]
+    request_suffix = f"|{parts[3]}" if len(parts) > 3 and parts[3] else ""
     requested_days = int(requested_days)
     leave_type_id = int(leave_type_id)
-    manager_id = MANAGER_USER_ID
+    manager_id = get_manager_for(user_id)
     try:
         if not USER_DISCUSSION_STATE.get(user_id, False):
             client.chat_update(
@@ -742,25 +985,26 @@ def handle_rerequest_button(ack, body, client, logger):
                 }]
             )
             return
-        dm = client.conversations_open(users=manager_id)
-        channel_id = dm["channel"]["id"]
+        channel_id = open_dm_channel(client, manager_id)
         message = (
             f"<@{user_id}> has re-requested leave after discussion for *{requested_days} day(s)*.\n"
             "_Note: The user has already discussed this leave request with the manager._"
         )
-        client.chat_postMessage(
+        response = client.chat_postMessage(
             channel=channel_id,
             text="Leave re-request pending approval",
             blocks=[
                 {"type": "section", "text": {"type": "mrkdwn", "text": message}},
                 {"type": "actions", "block_id": "final_approval_buttons", "elements": [
                     {"type": "button", "text": {"type": "plain_text", "text": "Approve"}, "style": "primary",
-                     "value": f"{user_id}|approved|{requested_days}|{leave_type_id}", "action_id": "approve_button" },
+                     "value": f"{user_id}|approved|{requested_days}|{leave_type_id}{request_suffix}", "action_id": "approve_button" },
                     {"type": "button", "text": {"type": "plain_text", "text": "Decline"}, "style": "danger",
-                     "value": f"{user_id}|declined|{requested_days}|{leave_type_id}", "action_id": "decline_button" }
+                     "value": f"{user_id}|declined|{requested_days}|{leave_type_id}{request_suffix}", "action_id": "decline_button" }
                 ]}
             ],
         )
+        if request_suffix:
+            remember_manager_message([int(request_suffix[1:])], response["channel"], response["ts"])
         client.chat_update(
             channel=body["channel"]["id"],
             ts=body["message"]["ts"],
@@ -776,22 +1020,1063 @@ def handle_rerequest_button(ack, body, client, logger):
         logger.error(f"Failed to notify manager for re-request: {e}")
 
 
-@flask_app.route("/slack/events", methods=["POST"])
+# Manager digest mode: queue pending requests and send each manager one message per window
+DIGEST_REQUESTS_PER_MESSAGE = 20  # two blocks per request; Slack caps a message at 50 blocks
+DIGEST_DETAIL_CHARS = 600  # per proof/task field, so a section stays under Slack's 3000-character limit
+
+
+def queue_for_manager_digest(leave_request_id, manager_id, leave_days, remaining_balance=None, proof_details="", tasks_summary=""):
+    with flask_app.app_context():
+        db.session.add(ManagerDigestItem(
+            leave_request_id=leave_request_id, manager_id=manager_id,
+            leave_days=leave_days, remaining_balance=remaining_balance,
+            proof_details=proof_details or None, tasks_summary=tasks_summary or None,
+            queued_at=datetime.now(),
+        ))
+        db.session.commit()
+
+
+def claim_manager_digest_items():
+    """Claim every unsent item in one UPDATE and return the still-pending ones grouped by manager.
+
+    The UPDATE only touches rows nobody has claimed, so concurrent workers never send the same request
+    twice. Claims older than MANAGER_DIGEST_CLAIM_TIMEOUT_SECONDS belong to a sender that died before
+    sending or releasing them, and are taken over.
+    """
+    batch_id = uuid.uuid4().hex
+    batches = defaultdict(list)
+    now = datetime.now()
+    stale_before = now - timedelta(seconds=flask_app.config["MANAGER_DIGEST_CLAIM_TIMEOUT_SECONDS"])
+    with flask_app.app_context():
+        ManagerDigestItem.query.filter(db.or_(
+            ManagerDigestItem.batch_id.is_(None),
+            ManagerDigestItem.claimed_at < stale_before,
+        )).update({"batch_id": batch_id, "claimed_at": now}, synchronize_session=False)
+        db.session.commit()
+        items = ManagerDigestItem.query.filter_by(batch_id=batch_id).options(
+            joinedload(ManagerDigestItem.leave_request).joinedload(LeaveRequest.leave_type)
+        ).order_by(ManagerDigestItem.queued_at).all()
+        for item in items:
+            leave_request = item.leave_request
+            if leave_request.status != "pending":
+                db.session.delete(item)
+                continue
+            batches[item.manager_id].append({
+                "id": leave_request.id,
+                "user_id": leave_request.user_id,
+                "leave_type_id": leave_request.leave_type_id,
+                "leave_type": leave_request.leave_type.name,
+                "start_date": leave_request.start_date,
+                "end_date": leave_request.end_date,
+                "leave_days": item.leave_days,
+                "remaining_balance": item.remaining_balance,
+                "proof_details": item.proof_details,
+                "tasks_summary": item.tasks_summary,
+            })
+        db.session.commit()
+    return batches
+
+
+def _truncate(text, limit):
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def build_manager_digest_blocks(items):
+    blocks = [{"type": "section", "text": {"type": "mrkdwn", "text": f"*{len(items)} pending leave request(s)*"}}]
+    for item in items:
+        request_id = item["id"]
+        lines = [
+            f"<@{item['user_id']}> · *{item['leave_type']}* · {item['start_date']} to {item['end_date']} "
+            f"· {item['leave_days']} day(s)"
+        ]
+        if item["remaining_balance"] is not None:
+            lines.append(f"*Remaining {item['leave_type']} Leave:* {item['remaining_balance']}")
+        if item["proof_details"]:
+            lines.append(f"*Proof:* {_truncate(item['proof_details'], DIGEST_DETAIL_CHARS)}")
+        if item["tasks_summary"]:
+            lines.append(f"*Overlapping tasks:*\n{_truncate(item['tasks_summary'], DIGEST_DETAIL_CHARS)}")
+        else:
+            lines.append("No project/task deadlines overlap with the leave dates.")
+        blocks.append({
+            "type": "section",
+            "block_id": f"digest_request_{request_id}",
+            "text": {"type": "mrkdwn", "text": "\n".join(lines)},
+        })
+        blocks.append({
+            "type": "actions",
+            "block_id": f"digest_actions_{request_id}",
+            "elements": [
+                {"type": "button", "text": {"type": "plain_text", "text": "Approve"}, "style": "primary",
+                 "value": f"{request_id}|approved|{item['leave_days']}", "action_id": "digest_approve_button"},
+                {"type": "button", "text": {"type": "plain_text", "text": "Decline"}, "style": "danger",
+                 "value": f"{request_id}|declined|{item['leave_days']}", "action_id": "digest_decline_button"},
+                {"type": "button", "text": {"type": "plain_text", "text": "Discuss"},
+                 "value": f"{item['user_id']}|discuss|{item['leave_days']}|{item['leave_type_id']}|{request_id}", "action_id": "discuss_button"},
+            ],
+        })
+    blocks.append({
+        "type": "actions",
+        "block_id": "digest_bulk_actions",
+        "elements": [
+            {"type": "button", "text": {"type": "plain_text", "text": "Approve all"}, "style": "primary",
+             "value": ",".join(f"{item['id']}|{item['leave_days']}" for item in items),
+             "action_id": "digest_approve_all_button"},
+        ],
+    })
+    return blocks
+
+
+def release_manager_digest_items(leave_request_ids):
+    """Hand claimed items back to the queue so the next window retries them."""
+    with flask_app.app_context():
+        ManagerDigestItem.query.filter(ManagerDigestItem.leave_request_id.in_(leave_request_ids)).update(
+            {"batch_id": None, "claimed_at": None}, synchronize_session=False
+        )
+        db.session.commit()
+
+
+def send_manager_digests(client=None):
+    """Send one digest per manager (chunked to fit Slack's block limit); returns the number of requests sent.
+
+    The Slack client is only built once something has been claimed, so an empty queue makes no Slack calls.
+    """
+    batches = claim_manager_digest_items()
+    if not batches:
+        return 0
+    if client is None:
+        try:
+            client = get_bolt_app().client
+        except Exception:
+            release_manager_digest_items([item["id"] for items in batches.values() for item in items])
+            raise
+    sent = 0
+    for manager_id, items in batches.items():
+        for start in range(0, len(items), DIGEST_REQUESTS_PER_MESSAGE):
+            chunk = items[start:start + DIGEST_REQUESTS_PER_MESSAGE]
+            chunk_ids = [item["id"] for item in chunk]
+            try:
+                channel_id = open_dm_channel(client, manager_id)
+                response = client.chat_postMessage(
+                    channel=channel_id,
+                    text=f"{len(chunk)} pending leave request(s)",
+                    blocks=build_manager_digest_blocks(chunk),
+                )
+            except Exception as e:
+                flask_app.logger.error(f"Failed to send leave digest to manager {manager_id}: {e}")
+                release_manager_digest_items(chunk_ids)
+                continue
+            with flask_app.app_context():
+                ManagerDigestItem.query.filter(ManagerDigestItem.leave_request_id.in_(chunk_ids)).delete(
+                    synchronize_session=False
+                )
+                db.session.commit()
+            remember_manager_message(chunk_ids, response["channel"], response["ts"], is_digest=True)
+            sent += len(chunk)
+    return sent
+
+
+def decide_pending_leave_requests(client, requested_days_by_id, decision_text, manager_id):
+    """Decide several requests: all status changes and balance debits commit in one transaction,
+    then the employee/HR notifications go out. Requests that are no longer pending are skipped."""
+    with flask_app.app_context():
+        leave_requests = LeaveRequest.query.filter(
+            LeaveRequest.id.in_(list(requested_days_by_id)),
+            LeaveRequest.status == "pending",
+        ).order_by(LeaveRequest.id).all()
+        decided = []
+        for leave_request in leave_requests:
+            requested_days = requested_days_by_id[leave_request.id]
+            if not record_leave_decision(leave_request.user_id, leave_request.leave_type_id, requested_days, decision_text, leave_request):
+                continue
+            decided.append((leave_request.id, leave_request.user_id, requested_days, leave_request.start_date, leave_request.end_date))
+        db.session.commit()
+    if decided:
+        bump_calendar_feed_versions([user_id for _, user_id, *_ in decided])
+    for request_id, user_id, requested_days, start_dt, end_dt in decided:
+        try:
+            notify_leave_decision(client, user_id, requested_days, decision_text, manager_id, start_dt, end_dt)
+        except Exception as e:
+            flask_app.logger.error(f"Failed to send decision notifications for leave request {request_id}: {e}")
+    return {request_id: decision_text for request_id, *_ in decided}
+
+
+def digest_status_labels(request_ids, decisions, manager_id):
+    """Status lines for digest entries: the decision just made, or the row's actual status if it was
+    settled elsewhere (another click, a re-request, auto-expiry). Still-pending rows keep their buttons."""
+    labels = {request_id: f"*{decision.capitalize()}* by <@{manager_id}>" for request_id, decision in decisions.items()}
+    others = [request_id for request_id in request_ids if request_id not in labels]
+    if others:
+        with flask_app.app_context():
+            statuses = dict(db.session.execute(
+                db.select(LeaveRequest.id, LeaveRequest.status).where(LeaveRequest.id.in_(others))
+            ).all())
+        for request_id in others:
+            status = statuses.get(request_id)
+            if status == "pending":
+                continue
+            labels[request_id] = f"Already *{status}*" if status else "No longer pending"
+    return labels
+
+
+def mark_digest_blocks_decided(blocks, labels):
+    """Swap the buttons of settled requests for their status line; drop "Approve all" once nothing is left."""
+    updated = []
+    for block in blocks:
+        block_id = block.get("block_id", "")
+        if block["type"] == "actions" and block_id.startswith("digest_actions_"):
+            request_id = int(block_id.rsplit("_", 1)[1])
+            if request_id in labels:
+                updated.append({"type": "context", "block_id": block_id, "elements": [
+                    {"type": "mrkdwn", "text": labels[request_id]}
+                ]})
+                continue
+        updated.append(block)
+    if not any(b["type"] == "actions" and b.get("block_id", "").startswith("digest_actions_") for b in updated):
+        updated = [b for b in updated if b.get("block_id") != "digest_bulk_actions"]
+    return updated
+
+
+def handle_digest_decision(ack, body, client, logger):
+    ack()
+    leave_request_id, decision, requested_days = body["actions"][0]["value"].split("|")
+    leave_request_id = int(leave_request_id)
+    manager_id = body["user"]["id"]
+    decision_text = "approved" if decision == "approved" else "declined"
+    decisions = decide_pending_leave_requests(client, {leave_request_id: int(requested_days)}, decision_text, manager_id)
+    labels = digest_status_labels([leave_request_id], decisions, manager_id)
+    try:
+        client.chat_update(
+            channel=body["channel"]["id"],
+            ts=body["message"]["ts"],
+            text=body["message"].get("text", "Pending leave requests"),
+            blocks=mark_digest_blocks_decided(body["message"]["blocks"], labels),
+        )
+    except Exception as e:
+        logger.error(f"Failed to update leave digest: {e}")
+
+
+def handle_digest_approve_all(ack, body, client, logger):
+    ack()
+    requested_days_by_id = {}
+    for pair in body["actions"][0]["value"].split(","):
+        leave_request_id, requested_days = pair.split("|")
+        requested_days_by_id[int(leave_request_id)] = int(requested_days)
+    manager_id = body["user"]["id"]
+    decisions = decide_pending_leave_requests(client, requested_days_by_id, "approved", manager_id)
+    labels = digest_status_labels(list(requested_days_by_id), decisions, manager_id)
+    try:
+        client.chat_update(
+            channel=body["channel"]["id"],
+            ts=body["message"]["ts"],
+            text=body["message"].get("text", "Pending leave requests"),
+            blocks=mark_digest_blocks_decided(body["message"]["blocks"], labels),
+        )
+    except Exception as e:
+        logger.error(f"Failed to update leave digest: {e}")
+
+
+def start_manager_digest_worker():
+    """Send queued digests every MANAGER_DIGEST_WINDOW_SECONDS from a daemon thread.
+
+    Start it after forking (e.g. from gunicorn's post_fork); claiming is atomic, so running it in
+    several workers does not duplicate digests. Returns an Event that stops the thread when set.
+    """
+    state = _state()
+    if state["digest_worker"] is None:
+        app_ = flask_app
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(app_.config["MANAGER_DIGEST_WINDOW_SECONDS"]):
+                try:
+                    send_manager_digests()
+                except Exception as e:
+                    app_.logger.error(f"Manager digest run failed: {e}")
+
+        threading.Thread(target=run, name="manager-digest", daemon=True).start()
+        state["digest_worker"] = stop
+    return state["digest_worker"]
+
+
+@click.command("send-manager-digests")
+def send_manager_digests_command():
+    """Send all queued manager digests now."""
+    print(f"Sent {send_manager_digests()} leave request(s) in manager digests.")
+
+
+# Scheduler: reminders before approved leave, escalation of unanswered requests and expiry of
+# requests whose start date has passed. Due events are persisted in scheduled_leave_event and
+# mirrored in an in-memory min-heap; the scheduler thread sleeps until the earliest one is due.
+class LeaveScheduler:
+    def __init__(self, app_):
+        self.app = app_
+        self._heap = []  # (due_at, event_id)
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._next_resync = None
+        self._thread = None
+
+    def load(self):
+        """Rebuild the heap from scheduled_leave_event, e.g. after a restart.
+
+        Entries pushed while the SELECT was running are not in the snapshot, so they are merged back
+        in rather than dropped. Entries for events that have since fired elsewhere are harmless: firing
+        claims the row first and skips events that no longer exist.
+        """
+        with self.app.app_context():
+            rows = db.session.execute(
+                db.select(ScheduledLeaveEvent.due_at, ScheduledLeaveEvent.id).where(ScheduledLeaveEvent.fired_at.is_(None))
+            ).all()
+        heap = [tuple(row) for row in rows]
+        with self._cond:
+            snapshot_ids = {event_id for _, event_id in heap}
+            heap.extend(entry for entry in self._heap if entry[1] not in snapshot_ids)
+            heapq.heapify(heap)
+            self._heap = heap
+            resync = self.app.config["SCHEDULER_RESYNC_SECONDS"]
+            self._next_resync = time.monotonic() + resync if resync else None
+            self._cond.notify()
+
+    def push(self, events):
+        """Add (due_at, event_id) pairs; wakes the thread in case one is earlier than what it waits for."""
+        with self._cond:
+            for event in events:
+                heapq.heappush(self._heap, event)
+            self._cond.notify()
+
+    def start(self):
+        backfill_scheduled_leave_events()
+        self.load()
+        self._thread = threading.Thread(target=self.run, name="leave-scheduler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _wait_for_due(self):
+        """Block until events are due and return their IDs; [] means a resync is due, None means stopped."""
+        with self._cond:
+            while not self._stopped:
+                now = datetime.now()
+                if self._heap and self._heap[0][0] <= now:
+                    due = []
+                    while self._heap and self._heap[0][0] <= now:
+                        due.append(heapq.heappop(self._heap)[1])
+                    return due
+                timeout = (self._heap[0][0] - now).total_seconds() if self._heap else None
+                if self._next_resync is not None:
+                    until_resync = self._next_resync - time.monotonic()
+                    if until_resync <= 0:
+                        return []
+                    timeout = until_resync if timeout is None else min(timeout, until_resync)
+                self._cond.wait(timeout)
+        return None
+
+    def run(self):
+        while True:
+            due = self._wait_for_due()
+            if due is None:
+                return
+            if not due:
+                self.load()
+                continue
+            for event_id in due:
+                try:
+                    fire_scheduled_leave_event(event_id)
+                except Exception as e:
+                    self.app.logger.error(f"Scheduled leave event {event_id} failed: {e}")
+
+
+def schedule_leave_events(leave_request_id, start_dt, leave_type, escalate_at=None):
+    """Persist the reminder, escalation and expiry for a request and hand them to the running scheduler.
+
+    Sick leave never expires: it is filed after the fact. Any other request expires the day after its
+    start date, or straight away if that has already passed (only possible for requests backfilled from
+    before the scheduler existed); such a request is not escalated first. escalate_at defaults to
+    PENDING_ESCALATION_HOURS from now.
+    """
+    config = flask_app.config
+    now = datetime.now()
+    start_of_leave = datetime.combine(start_dt, datetime.min.time())
+    candidates = [
+        ("reminder", start_of_leave - timedelta(days=config["LEAVE_REMINDER_DAYS_BEFORE"]) + timedelta(hours=config["LEAVE_REMINDER_HOUR"])),
+    ]
+    expires_at = max(start_of_leave + timedelta(days=1), now) if leave_type != "Sick" else None
+    if expires_at != now:
+        candidates.append(("escalation", escalate_at or now + timedelta(hours=config["PENDING_ESCALATION_HOURS"])))
+    if expires_at:
+        candidates.append(("expiry", expires_at))
+    with flask_app.app_context():
+        events = [
+            ScheduledLeaveEvent(leave_request_id=leave_request_id, kind=kind, due_at=due_at)
+            for kind, due_at in candidates if kind != "reminder" or due_at > now
+        ]
+        db.session.add_all(events)
+        db.session.commit()
+        pushed = [(event.due_at, event.id) for event in events]
+    scheduler = _state()["scheduler"]
+    if scheduler:
+        scheduler.push(pushed)
+
+
+def backfill_scheduled_leave_events():
+    """Schedule events for pending requests that have none, i.e. ones submitted before the scheduler existed.
+
+    Their age is unknown, so the escalation is due straight away. Runs once when the scheduler starts;
+    returns the number of requests scheduled.
+    """
+    now = datetime.now()
+    with flask_app.app_context():
+        unscheduled = db.session.execute(
+            db.select(LeaveRequest.id, LeaveRequest.start_date, LeaveType.name)
+            .join(LeaveType, LeaveRequest.leave_type_id == LeaveType.id)
+            .where(
+                LeaveRequest.status == "pending",
+                ~db.exists().where(ScheduledLeaveEvent.leave_request_id == LeaveRequest.id),
+            )
+            .order_by(LeaveRequest.id)
+        ).all()
+    for leave_request_id, start_dt, leave_type in unscheduled:
+        schedule_leave_events(leave_request_id, start_dt, leave_type, escalate_at=now)
+    return len(unscheduled)
+
+
+def fire_scheduled_leave_event(event_id):
+    """Claim the event by stamping fired_at (so only one process fires it) and act on it if still relevant."""
+    with flask_app.app_context():
+        event = db.session.get(ScheduledLeaveEvent, event_id)
+        if not event or event.fired_at:
+            return False  # cancelled by a decision, or fired by another process
+        kind, leave_request_id = event.kind, event.leave_request_id
+        claimed = db.session.execute(
+            db.update(ScheduledLeaveEvent)
+            .where(ScheduledLeaveEvent.id == event_id, ScheduledLeaveEvent.fired_at.is_(None))
+            .values(fired_at=datetime.now())
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            return False
+        leave_request = db.session.get(LeaveRequest, leave_request_id, options=[joinedload(LeaveRequest.leave_type)])
+        if not leave_request:
+            return False
+        user_id = leave_request.user_id
+        leave_type = leave_request.leave_type.name
+        start_dt, end_dt, status = leave_request.start_date, leave_request.end_date, leave_request.status
+        manager_message = None
+        if kind == "expiry" and status == "pending":
+            manager_message = db.session.get(ManagerRequestMessage, leave_request_id)
+            if manager_message:
+                manager_message = (manager_message.channel_id, manager_message.message_ts, manager_message.is_digest)
+            # Conditional, so a decision that landed since the status was read wins
+            if not record_leave_decision(user_id, leave_request.leave_type_id, 0, "expired", leave_request):
+                db.session.refresh(leave_request)
+                status = leave_request.status
+            db.session.commit()
+    client = get_bolt_app().client
+    period = f"{start_dt} to {end_dt}"
+    if kind == "reminder" and status == "approved":
+        client.chat_postMessage(
+            channel=user_id,
+            text=f"Reminder: your *{leave_type}* leave ({period}) starts on *{start_dt.strftime('%A, %d %b')}*. Remember to hand over your open tasks.",
+        )
+    elif kind == "escalation" and status == "pending":
+        manager_id = get_manager_for(user_id)
+        client.chat_postMessage(
+            channel=open_dm_channel(client, manager_id),
+            text=f"⏰ The *{leave_type}* leave request from <@{user_id}> ({period}) is still waiting for your decision.",
+        )
+        client.chat_postMessage(
+            channel=flask_app.config["HR_CHANNEL_ID"],
+            text=f"Leave request from <@{user_id}> ({period}) has been pending with <@{manager_id}> for over "
+                 f"{flask_app.config['PENDING_ESCALATION_HOURS']} hours.",
+        )
+    elif kind == "expiry" and status == "pending":
+        client.chat_postMessage(
+            channel=user_id,
+            text=f"Your *{leave_type}* leave request ({period}) expired because it was not approved before it started. "
+                 "Please submit a new request if you still need the leave.",
+        )
+        expired_text = f"The *{leave_type}* leave request from <@{user_id}> ({period}) expired without a decision."
+        try:
+            update_expired_manager_message(client, leave_request_id, manager_message, expired_text)
+        except Exception as e:
+            flask_app.logger.error(f"Failed to update the manager's message for expired leave request {leave_request_id}: {e}")
+            manager_message = None
+        if not manager_message:
+            client.chat_postMessage(channel=open_dm_channel(client, get_manager_for(user_id)), text=expired_text)
+    else:
+        return False
+    return True
+
+
+def update_expired_manager_message(client, leave_request_id, manager_message, expired_text):
+    """Replace the buttons on the manager's message for a request that expired, so they can't be clicked."""
+    if not manager_message:
+        return
+    channel_id, message_ts, is_digest = manager_message
+    if not is_digest:
+        client.chat_update(
+            channel=channel_id,
+            ts=message_ts,
+            text=expired_text,
+            blocks=[{"type": "section", "text": {"type": "mrkdwn", "text": expired_text}}],
+        )
+        return
+    # A digest carries other requests too: only this request's row changes
+    history = client.conversations_history(channel=channel_id, latest=message_ts, inclusive=True, limit=1)
+    messages = history.get("messages") or []
+    if not messages:
+        return
+    client.chat_update(
+        channel=channel_id,
+        ts=message_ts,
+        text=messages[0].get("text", "Pending leave requests"),
+        blocks=mark_digest_blocks_decided(messages[0]["blocks"], {leave_request_id: "Expired without a decision"}),
+    )
+
+
+def start_leave_scheduler():
+    """Start the scheduler thread for this process (loading every persisted event first)."""
+    state = _state()
+    if state["scheduler"] is None:
+        state["scheduler"] = LeaveScheduler(flask_app).start()
+    return state["scheduler"]
+
+
+@click.command("run-scheduler")
+def run_scheduler_command():
+    """Run the leave scheduler in the foreground as a dedicated process."""
+    scheduler = LeaveScheduler(flask_app)
+    _state()["scheduler"] = scheduler
+    backfill_scheduled_leave_events()
+    scheduler.load()
+    scheduler.run()
+
+
+# Archival: leave_request only holds pending and recent requests; older finished ones live in
+# leave_request_archive, and reporting reads both through leave_request_history().
+FINISHED_STATUSES = ["approved", "declined", "expired"]
+_HISTORY_COLUMNS = ["id", "user_id", "leave_type_id", "start_date", "end_date", "status"]
+
+
+def leave_request_history(after_id=None, limit=None, start=None, end=None, statuses=None, leave_type=None):
+    """UNION ALL of live and archived requests, for reporting queries that need the full history.
+
+    Filters, the keyset bound (id > after_id) and the page size are applied inside each arm, so both
+    tables are read through their ID index and neither arm returns more than limit rows.
+    """
+    arms = []
+    for model, request_id in ((LeaveRequest, LeaveRequest.id), (LeaveRequestArchive, LeaveRequestArchive.original_id)):
+        arm = db.select(request_id.label("id"), *[getattr(model, name) for name in _HISTORY_COLUMNS[1:]])
+        if after_id is not None:
+            arm = arm.where(request_id > after_id)
+        if start:
+            arm = arm.where(model.end_date >= start)
+        if end:
+            arm = arm.where(model.start_date <= end)
+        if statuses:
+            arm = arm.where(model.status.in_(statuses))
+        if leave_type:
+            arm = arm.where(model.leave_type_id.in_(db.select(LeaveType.id).where(LeaveType.name == leave_type)))
+        if limit:
+            # SQLite only allows ORDER BY/LIMIT on a UNION member when it is wrapped in a subquery
+            arm = db.select(arm.order_by(request_id).limit(limit).subquery())
+        arms.append(arm)
+    return db.union_all(*arms).subquery("leave_request_history")
+
+
+def archive_finished_leave_requests(retention_days=None, batch_size=None):
+    """Move finished requests that ended before the retention horizon into leave_request_archive.
+
+    Each batch is copied and deleted in its own transaction, so the job can be interrupted and rerun
+    at any point. Requests still queued for a manager digest or with unfired scheduled events are left alone.
+    The row with the highest ID is never moved: leave_request has no AUTOINCREMENT, so SQLite hands
+    out max(id) + 1 and would otherwise reuse archived IDs. Returns the number moved.
+    """
+    if retention_days is None:
+        retention_days = flask_app.config["ARCHIVE_RETENTION_DAYS"]
+    batch_size = batch_size or flask_app.config["ARCHIVE_BATCH_SIZE"]
+    horizon = date.today() - timedelta(days=retention_days)
+    moved = 0
+    with flask_app.app_context():
+        while True:
+            ids = db.session.execute(
+                db.select(LeaveRequest.id)
+                .where(
+                    LeaveRequest.status.in_(FINISHED_STATUSES),
+                    LeaveRequest.end_date < horizon,
+                    ~db.exists().where(ManagerDigestItem.leave_request_id == LeaveRequest.id),
+                    ~db.exists().where(
+                        ScheduledLeaveEvent.leave_request_id == LeaveRequest.id, ScheduledLeaveEvent.fired_at.is_(None)
+                    ),
+                    LeaveRequest.id < db.select(db.func.max(LeaveRequest.id)).scalar_subquery(),
+                )
+                .order_by(LeaveRequest.id)
+                .limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            columns = [getattr(LeaveRequest, name) for name in _HISTORY_COLUMNS]
+            db.session.execute(
+                db.insert(LeaveRequestArchive).from_select(
+                    ["original_id"] + _HISTORY_COLUMNS[1:] + ["archived_at"],
+                    db.select(*columns, db.literal(datetime.now(), db.DateTime)).where(LeaveRequest.id.in_(ids)),
+                )
+            )
+            db.session.execute(db.delete(ScheduledLeaveEvent).where(ScheduledLeaveEvent.leave_request_id.in_(ids)))
+            db.session.execute(db.delete(LeaveRequest).where(LeaveRequest.id.in_(ids)))
+            db.session.commit()
+            moved += len(ids)
+    return moved
+
+
+@click.command("archive-leave-requests")
+@click.option("--retention-days", type=int, help="Keep finished requests that ended within this many days; defaults to ARCHIVE_RETENTION_DAYS.")
+@click.option("--batch-size", type=int, help="Rows moved per transaction; defaults to ARCHIVE_BATCH_SIZE.")
+def archive_leave_requests_command(retention_days, batch_size):
+    """Move old finished leave requests into leave_request_archive."""
+    print(f"Archived {archive_finished_leave_requests(retention_days, batch_size)} leave request(s).")
+
+
+# HR leave-history export, streamed in chunks so memory stays flat regardless of row count
+EXPORT_MIMETYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_COLUMNS = ["request_id", "user_id", "leave_type", "start_date", "end_date", "status", "leave_balance"]
+
+
+def parse_export_filters(start=None, end=None, status=None, leave_type=None):
+    """Turn raw query-string/CLI values into leave_history_query() kwargs; raises ValueError on bad dates."""
+    filters = {}
+    if start:
+        filters["start"] = datetime.strptime(start, "%Y-%m-%d").date()
+    if end:
+        filters["end"] = datetime.strptime(end, "%Y-%m-%d").date()
+    if status:
+        filters["statuses"] = [s.strip() for s in status.split(",") if s.strip()]
+    if leave_type:
+        filters["leave_type"] = leave_type
+    return filters
+
+
+def leave_history_query(after_id=0, limit=None, **filters):
+    """One page of live and archived requests overlapping [start, end], joined to their leave type and
+    current balance in SQL. The first column is the request ID, used as the page key."""
+    history = leave_request_history(after_id=after_id, limit=limit, **filters)
+    query = (
+        db.select(
+            history.c.id, history.c.user_id, LeaveType.name, history.c.start_date,
+            history.c.end_date, history.c.status, UserLeaveBalance.leave_balance,
+        )
+        .join(LeaveType, history.c.leave_type_id == LeaveType.id)
+        .outerjoin(UserLeaveBalance, db.and_(
+            UserLeaveBalance.user_id == history.c.user_id,
+            UserLeaveBalance.leave_type_id == history.c.leave_type_id,
+        ))
+        .order_by(history.c.id)
+    )
+    return query.limit(limit) if limit else query
+
+
+def iter_leave_history(chunk_size, **filters):
+    """Yield lists of up to chunk_size rows from live and archived requests in request-ID order.
+
+    Pages are keyset-paged (WHERE id > last ORDER BY id LIMIT n). Each page is one statement over both
+    tables in its own short transaction: a slow download never holds a read lock that would block
+    approvals and submissions on SQLite, and a request moved by a concurrent archival batch is seen
+    exactly once, either live or archived.
+    """
+    last_id = 0
+    while True:
+        with flask_app.app_context():
+            rows = db.session.execute(leave_history_query(after_id=last_id, limit=chunk_size, **filters)).all()
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1][0]
+
+
+def _csv_chunks(partitions):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buf.getvalue().encode("utf-8")  # header goes out before the first query round-trip
+    for partition in partitions:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(partition)
+        yield buf.getvalue().encode("utf-8")
+
+
+def _jsonl_chunks(partitions):
+    for partition in partitions:
+        lines = []
+        for row in partition:
+            record = dict(zip(EXPORT_COLUMNS, row))
+            record["start_date"] = record["start_date"].isoformat()
+            record["end_date"] = record["end_date"].isoformat()
+            lines.append(json.dumps(record))
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class _DrainableSink:
+    """Write-only file object the Parquet writer fills; drain() hands back what has been written so far."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _parquet_chunks(partitions):
+    # pyarrow is optional and heavy; only the parquet format needs it
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("request_id", pa.int64()), ("user_id", pa.string()), ("leave_type", pa.string()),
+        ("start_date", pa.date32()), ("end_date", pa.date32()), ("status", pa.string()),
+        ("leave_balance", pa.int64()),
+    ])
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for partition in partitions:
+        columns = list(zip(*partition))
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+        ))  # one row group per chunk
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def parquet_export_available():
+    import importlib.util
+
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def stream_leave_history(fmt, chunk_size=None, **filters):
+    """Return a generator of encoded byte chunks for the given export format."""
+    partitions = iter_leave_history(chunk_size or flask_app.config["EXPORT_CHUNK_SIZE"], **filters)
+    if fmt == "csv":
+        return _csv_chunks(partitions)
+    if fmt == "jsonl":
+        return _jsonl_chunks(partitions)
+    if fmt == "parquet":
+        return _parquet_chunks(partitions)
+    raise ValueError(f"Unsupported export format: {fmt}")
+
+
+def export_leave_history():
+    token = flask_app.config["HR_EXPORT_TOKEN"]
+    if not token:
+        return jsonify({"error": "Leave history export is disabled."}), 404
+    if not hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()):
+        return jsonify({"error": "Unauthorized."}), 401
+    fmt = request.args.get("format", "csv")
+    if fmt not in EXPORT_MIMETYPES:
+        return jsonify({"error": f"format must be one of: {', '.join(EXPORT_MIMETYPES)}."}), 400
+    if fmt == "parquet" and not parquet_export_available():
+        return jsonify({"error": "Parquet export requires pyarrow to be installed."}), 400
+    try:
+        filters = parse_export_filters(
+            request.args.get("start"), request.args.get("end"),
+            request.args.get("status"), request.args.get("leave_type"),
+        )
+    except ValueError:
+        return jsonify({"error": "start and end must be dates in YYYY-MM-DD format."}), 400
+    return Response(
+        stream_with_context(stream_leave_history(fmt, **filters)),
+        mimetype=EXPORT_MIMETYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="leave_history.{fmt}"'},
+    )
+
+
+@click.command("export-leave-history")
+@click.option("--format", "fmt", type=click.Choice(list(EXPORT_MIMETYPES)), default="csv", show_default=True)
+@click.option("--output", "-o", type=click.Path(dir_okay=False, writable=True), help="File to write; defaults to stdout.")
+@click.option("--start", help="Only requests ending on or after this date (YYYY-MM-DD).")
+@click.option("--end", help="Only requests starting on or before this date (YYYY-MM-DD).")
+@click.option("--status", help="Comma-separated statuses, e.g. approved,pending.")
+@click.option("--leave-type", help="Leave type name, e.g. Casual.")
+@click.option("--chunk-size", type=int, help="Rows fetched per round-trip; defaults to EXPORT_CHUNK_SIZE.")
+def export_leave_history_command(fmt, output, start, end, status, leave_type, chunk_size):
+    """Stream leave history as CSV, JSONL or Parquet."""
+    if fmt == "parquet" and not parquet_export_available():
+        raise click.UsageError("Parquet export requires pyarrow to be installed.")
+    try:
+        filters = parse_export_filters(start, end, status, leave_type)
+    except ValueError:
+        raise click.BadParameter("start and end must be dates in YYYY-MM-DD format.")
+    out = open(output, "wb") if output else sys.stdout.buffer
+    try:
+        for chunk in stream_leave_history(fmt, chunk_size, **filters):
+            out.write(chunk)
+    finally:
+        if output:
+            out.close()
+
+
+# Absence calendar (.ics) feeds. Each feed is rendered once and cached with the version it was built
+# from; approvals and declines bump the versions, so polls in between are answered from memory.
+_calendar_lock = threading.Lock()
+TEAM_FEED = "team"
+
+
+def bump_calendar_feed_versions(user_ids):
+    """Invalidate the team feed and the feeds of the given users."""
+    versions = _state()["calendar_versions"]
+    with _calendar_lock:
+        for key in {TEAM_FEED, *user_ids}:
+            versions[key] = versions.get(key, 0) + 1
+
+
+USER_NAME_RETRY_SECONDS = 3600  # failed users_info lookups fall back to the Slack ID until then
+
+
+def get_user_display_name(user_id):
+    """Slack display name for feed summaries. Failures (e.g. no users:read scope) are cached too, so a
+    feed re-render makes at most one failing users_info call per user per USER_NAME_RETRY_SECONDS."""
+    names = _state()["user_names"]
+    cached = names.get(user_id)
+    if cached and (cached[1] is None or time.monotonic() < cached[1]):
+        return cached[0]
+    try:
+        profile = get_bolt_app().client.users_info(user=user_id)["user"]
+        names[user_id] = (profile.get("real_name") or profile.get("name") or user_id, None)
+    except Exception as e:
+        flask_app.logger.error(f"Failed to look up Slack user {user_id}: {e}")
+        names[user_id] = (user_id, time.monotonic() + USER_NAME_RETRY_SECONDS)
+    return names[user_id][0]
+
+
+def _ics_escape(text):
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _ics_fold(line):
+    """RFC 5545 line folding: at most 75 octets per line, continuation lines start with a space."""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74
+        while (encoded[cut] & 0xC0) == 0x80:  # don't split a UTF-8 sequence
+            cut -= 1
+        parts.append(encoded[:cut].decode("utf-8"))
+        encoded = encoded[cut:]
+    parts.append(encoded.decode("utf-8"))
+    return "\r\n ".join(parts)
+
+
+def render_calendar_feed(user_id=None):
+    """Approved leave ending within the last CALENDAR_FEED_PAST_DAYS, as an iCalendar document."""
+    horizon = date.today() - timedelta(days=flask_app.config["CALENDAR_FEED_PAST_DAYS"])
+    with flask_app.app_context():
+        query = (
+            db.select(LeaveRequest.id, LeaveRequest.user_id, LeaveType.name, LeaveRequest.start_date, LeaveRequest.end_date)
+            .join(LeaveType, LeaveRequest.leave_type_id == LeaveType.id)
+            .where(LeaveRequest.status == "approved", LeaveRequest.end_date >= horizon)
+            .order_by(LeaveRequest.start_date, LeaveRequest.id)
+        )
+        if user_id:
+            query = query.where(LeaveRequest.user_id == user_id)
+        leaves = db.session.execute(query).all()
+
+    calendar_name = f"Leave: {get_user_display_name(user_id)}" if user_id else "Team absences"
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//Slack Leave App//Absence Feed//EN",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_ics_escape(calendar_name)}",
+    ]
+    for leave_id, leave_user_id, leave_type, start_dt, end_dt in leaves:
+        summary = f"{leave_type} leave" if user_id else f"{get_user_display_name(leave_user_id)} – {leave_type} leave"
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:leave-{leave_id}@slack-leave-app",
+            f"DTSTAMP:{start_dt.strftime('%Y%m%d')}T000000Z",  # derived from the row so unchanged feeds hash the same
+            f"DTSTART;VALUE=DATE:{start_dt.strftime('%Y%m%d')}",
+            f"DTEND;VALUE=DATE:{(end_dt + timedelta(days=1)).strftime('%Y%m%d')}",  # DTEND is exclusive
+            f"SUMMARY:{_ics_escape(summary)}",
+            "TRANSP:TRANSPARENT",
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return ("\r\n".join(_ics_fold(line) for line in lines) + "\r\n").encode("utf-8")
+
+
+def get_calendar_feed(key):
+    """Return the cached feed entry for key ("team" or a user ID), re-rendering only when its version
+    moved or it is older than CALENDAR_FEED_MAX_AGE_SECONDS (which also covers decisions made in
+    other worker processes). The ETag is a content hash, so a re-render with no changes keeps it.
+
+    Returns None for a user ID the app has never seen, so made-up IDs neither grow the cache nor cost
+    a render and a Slack users_info call."""
+    state = _state()
+    version = state["calendar_versions"].get(key, 0)
+    cached = state["calendar_feeds"].get(key)
+    if not cached and key != TEAM_FEED:
+        with flask_app.app_context():
+            known = db.session.execute(
+                db.select(UserLeaveBalance.user_id).where(UserLeaveBalance.user_id == key).limit(1)
+            ).first()
+        if not known:
+            return None
+    max_age = flask_app.config["CALENDAR_FEED_MAX_AGE_SECONDS"]
+    if cached and cached["version"] == version and time.monotonic() - cached["rendered_at"] < max_age:
+        return cached
+    body = render_calendar_feed(None if key == TEAM_FEED else key)
+    etag = hashlib.sha1(body).hexdigest()
+    if cached and cached["etag"] == etag:
+        last_modified = cached["last_modified"]
+    else:
+        last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+    entry = {"version": version, "rendered_at": time.monotonic(), "body": body, "etag": etag, "last_modified": last_modified}
+    with _calendar_lock:
+        state["calendar_feeds"][key] = entry
+    return entry
+
+
+def _calendar_response(key):
+    token = flask_app.config["CALENDAR_FEED_TOKEN"]
+    if not token:
+        return jsonify({"error": "Calendar feeds are disabled."}), 404
+    if not hmac.compare_digest(request.args.get("token", "").encode(), token.encode()):
+        return jsonify({"error": "Unauthorized."}), 401
+    feed = get_calendar_feed(key)
+    if feed is None:
+        return jsonify({"error": "Unknown user."}), 404
+    response = Response(feed["body"], mimetype="text/calendar")
+    response.set_etag(feed["etag"])
+    response.last_modified = feed["last_modified"]
+    response.cache_control.private = True
+    response.cache_control.no_cache = True  # always revalidate; the 304 path is cheap
+    return response.make_conditional(request)
+
+
+def team_calendar_feed():
+    return _calendar_response(TEAM_FEED)
+
+
+def user_calendar_feed(user_id):
+    return _calendar_response(user_id)
+
+
 def slack_events():
     if request.headers.get("content-type") == "application/json":
         data = request.get_json()
         if data.get("type") == "url_verification":
             return jsonify({"challenge": data["challenge"]})
-    return handler.handle(request)
+    return get_slack_handler().handle(request)
 
 
-@flask_app.route("/", methods=["GET"])
 def home():
     return "Slack Leave App is running!", 200
 
 
-if __name__ == "__main__":
-    with flask_app.app_context():
+def register_slack_listeners(bolt_app):
+    bolt_app.command("/applyforleave")(open_leave_modal)
+    bolt_app.view("leave_request_modal")(handle_leave_submission)
+    bolt_app.command("/whos_away")(whos_away_command)
+    bolt_app.view("whos_away_modal")(whos_away_modal_submission)
+    bolt_app.command("/leave_balance")(leave_balance_command)
+    bolt_app.action("approve_button")(handle_final_decision)
+    bolt_app.action("decline_button")(handle_final_decision)
+    bolt_app.action("discuss_button")(handle_discuss_action)
+    bolt_app.action("rerequest_button")(handle_rerequest_button)
+    bolt_app.action("digest_approve_button")(handle_digest_decision)
+    bolt_app.action("digest_decline_button")(handle_digest_decision)
+    bolt_app.action("digest_approve_all_button")(handle_digest_approve_all)
+
+
+def create_app(config=None):
+    """Build the Flask app without any network or database I/O.
+
+    The Bolt app (and its auth.test call), the Slack request handler and the
+    Notion client are all created on first use. Call warm_up() afterwards to
+    create tables and load the leave-type catalog up front.
+    """
+    global flask_app
+    new_app = Flask(__name__)
+    new_app.config.update(DEFAULT_CONFIG)
+    if config:
+        new_app.config.update(config)
+    db.init_app(new_app)
+    new_app.extensions["slack_leave"] = {
+        "bolt_app": None,
+        "slack_handler": None,
+        "notion_client": None,
+        "leave_type_catalog": None,
+        "org_manager_map": None,
+        "dm_channels": {},
+        "digest_worker": None,
+        "calendar_versions": {},
+        "calendar_feeds": {},
+        "user_names": {},
+        "scheduler": None,
+    }
+    new_app.add_url_rule("/slack/events", view_func=slack_events, methods=["POST"])
+    new_app.add_url_rule("/", view_func=home, methods=["GET"])
+    new_app.add_url_rule("/hr/leave_history", view_func=export_leave_history, methods=["GET"])
+    new_app.add_url_rule("/calendar/team.ics", view_func=team_calendar_feed, methods=["GET"])
+    new_app.add_url_rule("/calendar/users/<user_id>.ics", view_func=user_calendar_feed, methods=["GET"])
+    new_app.cli.add_command(send_manager_digests_command)
+    new_app.cli.add_command(export_leave_history_command)
+    new_app.cli.add_command(archive_leave_requests_command)
+    new_app.cli.add_command(run_scheduler_command)
+    flask_app = new_app
+    return new_app
+
+
+def warm_up(app_=None):
+    """Pre-fork hook: create tables, seed and cache the leave-type catalog, then
+    drop pooled connections so forked workers each open their own.
+
+    With gunicorn, run with ``preload_app = True`` and call this from
+    ``when_ready(server)``, which fires in the master before workers fork.
+    """
+    app_ = app_ or flask_app
+    with app_.app_context():
         db.create_all()
         initialize_leave_types_and_user_balances()
+        load_leave_type_catalog()
+        db.engine.dispose()
+    return app_
+
+
+if __name__ == "__main__":
+    warm_up(create_app())
+    if flask_app.config["MANAGER_DIGEST_ENABLED"]:
+        start_manager_digest_worker()
+    start_leave_scheduler()
     flask_app.run(host="0.0.0.0", port=8000)
@@ -0,0 +1,101 @@
+"""Hot-path query timings before and after archiving a 5-year synthetic history.
+
+    python bench_archive.py [employees] [requests_per_employee_per_year]
+
+Times the /whos_away range filter, the by-ID request lookup used by the
+approve/decline handlers and the (user, leave type, pending) lookup that only
+buttons sent before request IDs were added still use. Then runs
+archive_finished_leave_requests() with the default retention, times them
+again and checks that leave_request_history() still returns every row.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import app
+
+YEARS = 5
+
+
+def seed(employees, per_year):
+    rng = random.Random(42)
+    today = date.today()
+    first_day = today - timedelta(days=YEARS * 365)
+    rows = []
+    with app.flask_app.app_context():
+        leave_type_ids = [lt["id"] for lt in app.load_leave_type_catalog()]
+        insert = app.LeaveRequest.__table__.insert()
+        for e in range(employees):
+            for _ in range(YEARS * per_year):
+                start = first_day + timedelta(days=rng.randrange(YEARS * 365 + 60))
+                if start > today:
+                    status = rng.choice(["approved", "pending"])
+                else:
+                    status = rng.choice(["approved", "approved", "declined"])
+                rows.append({
+                    "user_id": f"U{e:05d}", "leave_type_id": rng.choice(leave_type_ids),
+                    "start_date": start, "end_date": start + timedelta(days=rng.randrange(4)),
+                    "status": status,
+                })
+        app.db.session.execute(insert, rows)
+        app.db.session.commit()
+    return len(rows)
+
+
+def time_hot_queries(employees, repeat=50):
+    rng = random.Random(7)
+    today = date.today()
+    with app.flask_app.app_context():
+        pending_ids = app.db.session.execute(
+            app.db.select(app.LeaveRequest.id).where(app.LeaveRequest.status == "pending")
+        ).scalars().all()
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            app.LeaveRequest.query.filter(
+                app.LeaveRequest.status == "approved",
+                app.LeaveRequest.start_date <= today + timedelta(days=29),
+                app.LeaveRequest.end_date >= today,
+            ).all()
+        whos_away = (time.perf_counter() - t0) / repeat
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            app.db.session.get(app.LeaveRequest, rng.choice(pending_ids), populate_existing=True)
+        approval = (time.perf_counter() - t0) / repeat
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            app.LeaveRequest.query.filter_by(
+                user_id=f"U{rng.randrange(employees):05d}", leave_type_id=1, status="pending",
+            ).order_by(app.LeaveRequest.id.desc()).first()
+        legacy_approval = (time.perf_counter() - t0) / repeat
+    return whos_away, approval, legacy_approval
+
+
+def main():
+    employees = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    per_year = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    with tempfile.TemporaryDirectory() as tmp:
+        flask_app = app.create_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(tmp, "archive.db")})
+        app.warm_up(flask_app)
+        total = seed(employees, per_year)
+        before = time_hot_queries(employees)
+
+        t0 = time.perf_counter()
+        moved = app.archive_finished_leave_requests()
+        archive_seconds = time.perf_counter() - t0
+        after = time_hot_queries(employees)
+
+        with flask_app.app_context():
+            history = app.leave_request_history()
+            history_rows = app.db.session.execute(app.db.select(app.db.func.count()).select_from(history)).scalar()
+
+    print(f"{total} requests over {YEARS} years; archived {moved} in {archive_seconds:.2f} s "
+          f"({total - moved} left hot, {history_rows} visible through leave_request_history)")
+    for label, b, a in zip(("whos_away range", "approval by ID", "legacy lookup"), before, after):
+        print(f"{label:<16} before {b * 1000:7.2f} ms   after {a * 1000:7.2f} ms   speedup {b / a:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
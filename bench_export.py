@@ -0,0 +1,68 @@
+"""Peak-memory benchmark for the streaming leave-history export.
+
+Builds a synthetic SQLite database per size, streams the whole export to
+nowhere, and reports the tracemalloc peak. The peak should stay roughly the
+same from the smallest to the largest size:
+
+    python bench_export.py [format] [rows ...]     # e.g. python bench_export.py csv 1000 100000 1000000
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import app
+
+STATUSES = ["approved", "declined", "pending"]
+
+
+def seed(n_rows):
+    rng = random.Random(n_rows)
+    base = date(2020, 1, 1)
+    rows = []
+    with app.flask_app.app_context():
+        leave_type_ids = [lt["id"] for lt in app.load_leave_type_catalog()]
+        insert = app.LeaveRequest.__table__.insert()
+        for i in range(n_rows):
+            start = base + timedelta(days=rng.randrange(5 * 365))
+            rows.append({
+                "user_id": f"U{rng.randrange(500):05d}", "leave_type_id": rng.choice(leave_type_ids),
+                "start_date": start, "end_date": start + timedelta(days=rng.randrange(5)),
+                "status": rng.choice(STATUSES),
+            })
+            if len(rows) == 50000:
+                app.db.session.execute(insert, rows)
+                rows = []
+        if rows:
+            app.db.session.execute(insert, rows)
+        app.db.session.commit()
+
+
+def measure(fmt, n_rows, tmp):
+    flask_app = app.create_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(tmp, f"export_{n_rows}.db")})
+    app.warm_up(flask_app)
+    seed(n_rows)
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    size = 0
+    for chunk in app.stream_leave_history(fmt):
+        size += len(chunk)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{n_rows:>10} rows   {size / 1e6:9.1f} MB out   {elapsed:7.2f} s   peak {peak / 1e6:7.2f} MB")
+
+
+def main():
+    fmt = sys.argv[1] if len(sys.argv) > 1 else "csv"
+    sizes = [int(n) for n in sys.argv[2:]] or [1000, 100000, 1000000]
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rows in sizes:
+            measure(fmt, n_rows, tmp)
+
+
+if __name__ == "__main__":
+    main()
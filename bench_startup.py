@@ -0,0 +1,70 @@
+"""Import-time and cold-start benchmark for app.py.
+
+Each sample runs in a fresh interpreter so module caches don't hide the cost:
+
+    python bench_startup.py [runs]
+
+"import" is ``import app``; "cold start" is import + create_app() + warm_up()
+against a throwaway SQLite file + the first GET /. No Slack or Notion calls
+are made, since both clients are only built on first use.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import app
+print(time.perf_counter() - t0)
+"""
+
+COLD_START_SNIPPET = """
+import sys, time
+t0 = time.perf_counter()
+import app
+flask_app = app.create_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///" + sys.argv[1]})
+app.warm_up(flask_app)
+flask_app.test_client().get("/")
+print(time.perf_counter() - t0)
+"""
+
+EAGER_MODULES = ("slack_bolt", "notion_client", "dateutil.parser")
+
+
+def run_sample(snippet, *args):
+    out = subprocess.run(
+        [sys.executable, "-c", snippet, *args],
+        cwd=HERE, check=True, capture_output=True, text=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def loaded_optional_modules():
+    snippet = "import sys, app; print(','.join(m for m in %r if m in sys.modules))" % (EAGER_MODULES,)
+    out = subprocess.run([sys.executable, "-c", snippet], cwd=HERE, check=True, capture_output=True, text=True)
+    return out.stdout.strip() or "none"
+
+
+def report(label, samples):
+    print(f"{label:<12} median {statistics.median(samples) * 1000:8.1f} ms   "
+          f"min {min(samples) * 1000:8.1f} ms   max {max(samples) * 1000:8.1f} ms")
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    report("import", [run_sample(IMPORT_SNIPPET) for _ in range(runs)])
+    cold = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(runs):
+            cold.append(run_sample(COLD_START_SNIPPET, os.path.join(tmp, f"bench_{i}.db")))
+    report("cold start", cold)
+    print(f"optional integrations loaded at import: {loaded_optional_modules()}")
+
+
+if __name__ == "__main__":
+    main()
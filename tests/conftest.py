@@ -0,0 +1,73 @@
+import os
+import sys
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+@pytest.fixture
+def flask_app(tmp_path):
+    flask_app = app.create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'leaveapp.db'}"})
+    app.warm_up(flask_app)
+    return flask_app
+
+
+@pytest.fixture
+def add_leave_request(flask_app):
+    """Factory inserting a leave request (and its user's balances) directly; returns the request ID."""
+    def add(start_dt=None, status="pending", user_id="U1", leave_type="Casual", leave_days=1):
+        start_dt = start_dt or date.today() + timedelta(days=7)
+        with flask_app.app_context():
+            app.initialize_user_balances(user_id)
+            leave_request = app.LeaveRequest(
+                user_id=user_id, leave_type_id=app.LeaveType.query.filter_by(name=leave_type).one().id,
+                start_date=start_dt, end_date=start_dt + timedelta(days=leave_days - 1), status=status,
+            )
+            app.db.session.add(leave_request)
+            app.db.session.commit()
+            return leave_request.id
+    return add
+
+
+@pytest.fixture
+def leave_balance(flask_app):
+    def balance(user_id="U1", leave_type="Casual"):
+        with flask_app.app_context():
+            return app.UserLeaveBalance.query.join(app.LeaveType).filter(
+                app.UserLeaveBalance.user_id == user_id, app.LeaveType.name == leave_type,
+            ).one().leave_balance
+    return balance
+
+
+class FakeSlackClient:
+    def __init__(self):
+        self.posts = []
+        self.updates = []
+        self.lookups = []
+
+    def conversations_open(self, users):
+        return {"channel": {"id": f"D{users}"}}
+
+    def chat_postMessage(self, **kwargs):
+        self.posts.append(kwargs)
+        return {"channel": kwargs["channel"], "ts": str(len(self.posts))}
+
+    def chat_update(self, **kwargs):
+        self.updates.append(kwargs)
+
+    def users_info(self, user):
+        self.lookups.append(user)
+        return {"user": {"real_name": f"Name of {user}"}}
+
+
+@pytest.fixture
+def slack_client(monkeypatch):
+    """A recording Slack client, also returned by get_bolt_app() for code that builds its own."""
+    client = FakeSlackClient()
+    monkeypatch.setattr(app, "get_bolt_app", lambda: SimpleNamespace(client=client))
+    return client
@@ -0,0 +1,69 @@
+from datetime import date, timedelta
+
+import app
+
+
+def history_ids(flask_app):
+    with flask_app.app_context():
+        history = app.leave_request_history()
+        return sorted(app.db.session.execute(app.db.select(history.c.id)).scalars())
+
+
+def test_archive_insert_archive_again_keeps_ids_unique(flask_app, add_leave_request):
+    old = date.today() - timedelta(days=800)
+    archived = [add_leave_request(old + timedelta(days=i), status="approved") for i in range(3)]
+
+    assert app.archive_finished_leave_requests() == 2  # the highest ID stays so SQLite can't reuse it
+
+    new_id = add_leave_request(old + timedelta(days=10), status="approved")
+    assert new_id not in archived
+
+    assert app.archive_finished_leave_requests() == 1
+    assert history_ids(flask_app) == archived + [new_id]
+    with flask_app.app_context():
+        assert sorted(app.db.session.execute(app.db.select(app.LeaveRequestArchive.original_id)).scalars()) == archived
+
+
+def test_archive_skips_pending_and_recent_requests(flask_app, add_leave_request):
+    old = date.today() - timedelta(days=800)
+    pending_id = add_leave_request(old)
+    recent_id = add_leave_request(date.today() - timedelta(days=5), status="approved")
+    archived_id = add_leave_request(old + timedelta(days=1), status="declined")
+    add_leave_request(date.today(), status="approved")
+
+    assert app.archive_finished_leave_requests(batch_size=1) == 1
+    with flask_app.app_context():
+        live_ids = app.db.session.execute(app.db.select(app.LeaveRequest.id)).scalars().all()
+    assert pending_id in live_ids and recent_id in live_ids and archived_id not in live_ids
+
+
+def test_export_reads_live_and_archived_rows_in_id_order(flask_app, add_leave_request):
+    old = date.today() - timedelta(days=800)
+    ids = [add_leave_request(old + timedelta(days=i), status="approved") for i in range(5)]
+    app.archive_finished_leave_requests()
+
+    lines = b"".join(app.stream_leave_history("csv", chunk_size=2)).decode().splitlines()
+    assert [int(line.split(",")[0]) for line in lines[1:]] == ids
+
+
+def test_export_sees_each_row_once_while_archival_runs(flask_app, add_leave_request):
+    old = date.today() - timedelta(days=800)
+    ids = [add_leave_request(old + timedelta(days=i), status="approved") for i in range(10)]
+    ids.append(add_leave_request(date.today(), status="approved"))
+
+    pages = app.iter_leave_history(3)
+    exported = [row[0] for row in next(pages)]
+    assert app.archive_finished_leave_requests() == 10
+    exported += [row[0] for page in pages for row in page]
+
+    assert exported == ids
+
+
+def test_export_filters_apply_before_paging(flask_app, add_leave_request):
+    old = date.today() - timedelta(days=800)
+    ids = [add_leave_request(old + timedelta(days=i), status=("approved", "declined")[i % 2]) for i in range(8)]
+    app.archive_finished_leave_requests(batch_size=3)
+
+    rows = [row for page in app.iter_leave_history(2, statuses=["declined"], leave_type="Casual") for row in page]
+    assert [row[0] for row in rows] == ids[1::2]
+    assert {row[2] for row in rows} == {"Casual"}
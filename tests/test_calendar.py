@@ -0,0 +1,56 @@
+from datetime import date
+
+import pytest
+
+import app
+
+TOKEN = "feed-secret"
+
+
+@pytest.fixture
+def client(flask_app, slack_client, add_leave_request):
+    flask_app.config["CALENDAR_FEED_TOKEN"] = TOKEN
+    add_leave_request(date.today(), status="approved", leave_days=2)
+    return flask_app.test_client()
+
+
+def test_feed_requires_the_token(client):
+    assert client.get("/calendar/team.ics").status_code == 401
+    assert client.get("/calendar/team.ics?token=wrong").status_code == 401
+    assert client.get("/calendar/team.ics", query_string={"token": "fëed-sécret"}).status_code == 401
+    response = client.get(f"/calendar/team.ics?token={TOKEN}")
+    assert response.status_code == 200
+    assert b"Name of U1" in response.data
+
+
+def test_unchanged_feed_revalidates_with_304(client):
+    first = client.get(f"/calendar/users/U1.ics?token={TOKEN}")
+    assert first.status_code == 200 and first.headers["ETag"]
+
+    assert client.get(f"/calendar/users/U1.ics?token={TOKEN}",
+                      headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+    assert client.get(f"/calendar/users/U1.ics?token={TOKEN}",
+                      headers={"If-Modified-Since": first.headers["Last-Modified"]}).status_code == 304
+
+    # A decision bumps the version; the re-render has the same content, so the ETag holds
+    app.bump_calendar_feed_versions(["U1"])
+    assert client.get(f"/calendar/users/U1.ics?token={TOKEN}",
+                      headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+
+def test_changed_feed_gets_a_new_etag(client, add_leave_request):
+    first = client.get(f"/calendar/team.ics?token={TOKEN}")
+    add_leave_request(status="approved")
+    app.bump_calendar_feed_versions(["U1"])
+
+    second = client.get(f"/calendar/team.ics?token={TOKEN}", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 200
+    assert second.headers["ETag"] != first.headers["ETag"]
+
+
+def test_unknown_user_is_rejected_without_caching(client, slack_client, flask_app):
+    assert client.get(f"/calendar/users/UNKNOWN.ics?token={TOKEN}").status_code == 404
+    state = flask_app.extensions["slack_leave"]
+    assert "UNKNOWN" not in state["calendar_feeds"]
+    assert "UNKNOWN" not in state["calendar_versions"]
+    assert slack_client.lookups == []
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+import app
+
+
+def click(client, value):
+    body = {"actions": [{"value": value}], "user": {"id": "M"}, "channel": {"id": "DM"}, "message": {"ts": "1"}}
+    app.handle_final_decision(lambda: None, body, client, None)
+
+
+def test_approve_after_expiry_is_refused(flask_app, slack_client, add_leave_request, leave_balance):
+    client = slack_client
+    leave_request_id = add_leave_request(leave_days=2)
+    app.remember_manager_message([leave_request_id], "DM", "1")
+    before = leave_balance()
+    with flask_app.app_context():
+        event = app.ScheduledLeaveEvent(leave_request_id=leave_request_id, kind="expiry", due_at=datetime.now())
+        app.db.session.add(event)
+        app.db.session.commit()
+        event_id = event.id
+
+    assert app.fire_scheduled_leave_event(event_id)
+    assert "expired without a decision" in client.updates[-1]["text"]
+
+    click(client, f"U1|approved|2|1|{leave_request_id}")
+
+    assert "already *expired*" in client.updates[-1]["text"]
+    assert leave_balance() == before
+    with flask_app.app_context():
+        assert app.db.session.get(app.LeaveRequest, leave_request_id).status == "expired"
+
+
+def test_second_click_does_not_debit_twice(slack_client, add_leave_request, leave_balance, monkeypatch):
+    client = slack_client
+    monkeypatch.setattr(app, "notify_leave_decision", lambda *args: None)
+    leave_request_id = add_leave_request(leave_days=2)
+    before = leave_balance()
+
+    click(client, f"U1|approved|2|1|{leave_request_id}")
+    click(client, f"U1|approved|2|1|{leave_request_id}")
+
+    assert leave_balance() == before - 2
+    assert "already *approved*" in client.updates[-1]["text"]
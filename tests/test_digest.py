@@ -0,0 +1,75 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import app
+
+
+@pytest.fixture
+def digest_app(flask_app):
+    flask_app.config["MANAGER_DIGEST_ENABLED"] = True
+    return flask_app
+
+
+@pytest.fixture
+def queue_request(add_leave_request):
+    def queue(user_id, leave_days, start_in_days):
+        leave_request_id = add_leave_request(
+            date.today() + timedelta(days=start_in_days), user_id=user_id, leave_days=leave_days,
+        )
+        app.queue_for_manager_digest(leave_request_id, "M", leave_days)
+        return leave_request_id
+    return queue
+
+
+def test_approve_all_debits_every_request_in_one_commit(digest_app, slack_client, queue_request, leave_balance, monkeypatch):
+    monkeypatch.setattr(app, "notify_leave_decision", lambda *args: None)
+    first = queue_request("U1", 2, 10)
+    second = queue_request("U1", 3, 20)
+    before = leave_balance()
+
+    assert app.send_manager_digests(slack_client) == 2
+    digest = slack_client.posts[-1]
+    bulk = next(b for b in digest["blocks"] if b.get("block_id") == "digest_bulk_actions")["elements"][0]
+    body = {"actions": [bulk], "user": {"id": "M"}, "channel": {"id": digest["channel"]},
+            "message": {"ts": "1", "text": digest["text"], "blocks": digest["blocks"]}}
+
+    commits = []
+    count_commit = lambda session: commits.append(session)  # noqa: E731
+    event.listen(Session, "after_commit", count_commit)
+    try:
+        app.handle_digest_approve_all(lambda: None, body, slack_client, None)
+    finally:
+        event.remove(Session, "after_commit", count_commit)
+
+    assert len(commits) == 1
+    assert leave_balance() == before - 5
+    with digest_app.app_context():
+        assert {app.db.session.get(app.LeaveRequest, i).status for i in (first, second)} == {"approved"}
+    labels = [b["elements"][0]["text"] for b in slack_client.updates[-1]["blocks"] if b["type"] == "context"]
+    assert labels == ["*Approved* by <@M>", "*Approved* by <@M>"]
+    assert not any(b.get("block_id") == "digest_bulk_actions" for b in slack_client.updates[-1]["blocks"])
+
+
+def test_stale_claim_is_resent_and_fresh_claim_is_not(digest_app, slack_client, queue_request):
+    stale = queue_request("U1", 1, 10)
+    fresh = queue_request("U2", 1, 10)
+    timeout = digest_app.config["MANAGER_DIGEST_CLAIM_TIMEOUT_SECONDS"]
+    with digest_app.app_context():
+        for leave_request_id, claimed_at in ((stale, datetime.now() - timedelta(seconds=timeout + 1)), (fresh, datetime.now())):
+            item = app.db.session.get(app.ManagerDigestItem, leave_request_id)
+            item.batch_id, item.claimed_at = "crashed-sender", claimed_at
+        app.db.session.commit()
+
+    assert app.send_manager_digests(slack_client) == 1
+    assert f"digest_request_{stale}" in [b.get("block_id") for b in slack_client.posts[-1]["blocks"]]
+
+
+def test_empty_queue_makes_no_slack_calls(digest_app, monkeypatch):
+    def offline():
+        raise AssertionError("Slack client built for an empty queue")
+
+    monkeypatch.setattr(app, "get_bolt_app", offline)
+    assert app.send_manager_digests() == 0
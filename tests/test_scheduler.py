@@ -0,0 +1,48 @@
+from datetime import date, datetime, timedelta
+
+import app
+
+
+def scheduled(flask_app, leave_request_id):
+    with flask_app.app_context():
+        return {
+            event.kind: event
+            for event in app.ScheduledLeaveEvent.query.filter_by(leave_request_id=leave_request_id)
+        }
+
+
+def test_backfill_schedules_pending_requests_once(flask_app, slack_client, add_leave_request):
+    before = datetime.now()
+    leave_request_id = add_leave_request(date.today() + timedelta(days=10))
+
+    assert app.backfill_scheduled_leave_events() == 1
+    events = scheduled(flask_app, leave_request_id)
+    assert set(events) == {"reminder", "escalation", "expiry"}
+    assert events["escalation"].due_at <= datetime.now() and events["escalation"].due_at >= before
+
+    assert app.fire_scheduled_leave_event(events["escalation"].id)
+    assert len(slack_client.posts) == 2
+
+    # The fired escalation is kept, so a restart neither backfills nor fires it again
+    assert app.backfill_scheduled_leave_events() == 0
+    assert not app.fire_scheduled_leave_event(events["escalation"].id)
+
+
+def test_backfill_never_expires_sick_leave(flask_app, add_leave_request):
+    leave_request_id = add_leave_request(date.today() - timedelta(days=2), leave_type="Sick")
+
+    assert app.backfill_scheduled_leave_events() == 1
+    assert set(scheduled(flask_app, leave_request_id)) == {"escalation"}
+
+
+def test_backfill_expires_stale_casual_leave_now(flask_app, slack_client, add_leave_request):
+    leave_request_id = add_leave_request(date.today() - timedelta(days=2))
+
+    assert app.backfill_scheduled_leave_events() == 1
+    events = scheduled(flask_app, leave_request_id)
+    assert set(events) == {"expiry"}
+    assert events["expiry"].due_at <= datetime.now()
+
+    assert app.fire_scheduled_leave_event(events["expiry"].id)
+    with flask_app.app_context():
+        assert app.db.session.get(app.LeaveRequest, leave_request_id).status == "expired"